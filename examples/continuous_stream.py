@@ -1,6 +1,6 @@
 from tkinter import *
 from tkvideoutils import VideoRecorder
-import threading
+from concurrent.futures import ThreadPoolExecutor
 
 
 class Master_UI:
@@ -37,19 +37,25 @@ class Master_UI:
                 self.recording.start_playback()
 
         self.is_recording = False
+        # One reused worker runs the merges instead of creating a thread per recording
+        self.merge_pool = ThreadPoolExecutor(max_workers=1)
 
     def merge_sources(self):
         self.recording.close_video_recording()
-        merge_thread = threading.Thread(target=self.merge_sources_thread)
-        merge_thread.daemon = False
-        merge_thread.start()
-
-    def merge_sources_thread(self):
         self.video_count += 1
         self.merged_path = f"video_{self.video_count}.mp4"
-        if self.recording.merge_sources(self.merged_path, self.ffmpeg_exe, delete_file=False):
+        merge = self.merge_pool.submit(self.recording.merge_sources, self.merged_path, self.ffmpeg_exe,
+                                       delete_file=False)
+        self.master.after(200, self.poll_merge, merge)
+
+    def poll_merge(self, merge):
+        if not merge.done():
+            self.master.after(200, self.poll_merge, merge)
+        elif merge.result():
+            self.recording_label.config(text="Sources merged!")
             print("Sources merged!")
         else:
+            self.recording_label.config(text="Something went wrong")
             print("Something went wrong")
 
     # Function to start recording audio
@@ -80,6 +86,7 @@ class Master_UI:
 
 
 def on_closing():
+    app.merge_pool.shutdown(wait=True)
     root.quit()
     root.destroy()
 
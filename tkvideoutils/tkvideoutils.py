@@ -5,15 +5,19 @@ Copyright © 2022 Walker Arce (wsarcera@gmail.com)
 Released under the terms of the MIT license (https://opensource.org/licenses/MIT) as described in LICENSE.md
 """
 import _tkinter
+import concurrent.futures
+import json
+import logging
 import os
 import pathlib
+import platform
+import queue
 import shutil
+import subprocess
+import tempfile
 import time
-import traceback
 import wave
 from tkinter import ttk
-import ffmpy
-from moviepy.editor import AudioFileClip
 from ttkwidgets import TickScale
 
 try:
@@ -21,13 +25,72 @@ try:
 except ImportError:
     import tkinter as tk  # for Python3
 import threading
+import av
 import imageio
+import numpy as np
+import imageio_ffmpeg
 import cv2
 import pyaudio
-from itertools import count
+from itertools import chain, count
 from tkinter import *
 from PIL import Image, ImageTk
 
+log = logging.getLogger(__name__)
+
+
+def _user_cache_dir():
+    """
+    Gets the current user's cache directory for tkVideoUtils, so cached data is never shared between users through the
+    temp directory
+    :return: str: Absolute path to the directory, which may not exist yet
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    elif platform.system() == 'Darwin':
+        base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'tkvideoutils')
+
+
+def _bind_viewable(owner, label):
+    """
+    Keeps owner.viewable up to date from Map/Unmap events on the Label and its toplevel, so the per-frame paths don't
+    query Tk for the Label's visibility
+    :param owner: VideoPlayer or VideoRecorder: The object whose viewable attribute is updated
+    :param label: Tk Label: The Label that shows the video
+    :return: list: The (widget, sequence, funcid) bindings to pass to _unbind_viewable
+    """
+    def update_viewable(event=None):
+        try:
+            owner.viewable = bool(label.winfo_exists() and label.winfo_viewable())
+        except _tkinter.TclError:
+            owner.viewable = False
+
+    update_viewable()
+    bindings = []
+    for widget in (label, label.winfo_toplevel()):
+        for sequence in ('<Map>', '<Unmap>'):
+            bindings.append((widget, sequence, widget.bind(sequence, update_viewable, add='+')))
+    return bindings
+
+
+def _unbind_viewable(bindings):
+    """
+    Removes the bindings made by _bind_viewable, leaving any other bindings on the widgets in place
+    :param bindings: list: The bindings returned by _bind_viewable
+    :return: None
+    """
+    for widget, sequence, funcid in bindings:
+        try:
+            # Misc.unbind drops every script bound to the sequence before Python 3.13, so only this binding's line is
+            # removed from the script
+            script = '\n'.join(line for line in widget.bind(sequence).split('\n') if funcid not in line)
+            widget.tk.call('bind', str(widget), sequence, script)
+            widget.deletecommand(funcid)
+        except _tkinter.TclError:
+            pass
+
 
 class ImageLabel:
     """a label that displays images, and plays them if they are gifs
@@ -43,9 +106,11 @@ class ImageLabel:
         self.loc = 0
         self.frames = []
         self.label = label
+        interpolation = cv2.INTER_AREA if self.size[0] < im.size[0] else cv2.INTER_LINEAR
         try:
             for i in count(1):
-                self.frames.append(ImageTk.PhotoImage(im.copy().resize(self.size, Image.ANTIALIAS)))
+                frame = cv2.resize(np.asarray(im.convert('RGBA')), self.size, interpolation=interpolation)
+                self.frames.append(ImageTk.PhotoImage(Image.fromarray(frame)))
                 im.seek(i)
         except EOFError:
             pass
@@ -84,9 +149,23 @@ class VideoRecorder:
     """
     Class that handles the recording and streaming of video
     """
+    # Codec and FFMPEG output parameters used by the recording writer for each supported encoder, in the order they are
+    # tried when no encoder is requested.  The hardware encoders are probed, x264 is the software fallback.
+    ENCODERS = {'nvenc': ('h264_nvenc', ['-preset', 'p1', '-tune', 'll']),
+                'qsv': ('h264_qsv', ['-preset', 'veryfast']),
+                'amf': ('h264_amf', ['-usage', 'ultralowlatency', '-quality', 'speed']),
+                'x264': ('libx264', ['-preset', 'ultrafast', '-tune', 'zerolatency'])}
+    _encoders_available = {}
+    # Device polling is slow, so polled sources are kept for the process and shared with runs in the next few seconds
+    SOURCE_CACHE_PATH = os.path.join(_user_cache_dir(), 'devices.json')
+    SOURCE_CACHE_TTL_S = 30
+    _sources = {}
+    # Webcam indices that are probed at once, and how long a poll waits for them before unanswered ones are missing
+    MAX_VIDEO_SOURCES = 10
+    VIDEO_PROBE_TIMEOUT_S = 5
 
     def __init__(self, video_source, audio_source, video_path, audio_path, fps, label, size=(640, 360),
-                 keep_ratio=True, keep_playing=False):
+                 keep_ratio=True, keep_playing=False, encoder=None):
         """
         Streams, records, and handles webcam feeds
         :param video_source: tuple: Use VideoRecorder.get_video_sources() to get compatible sources
@@ -98,32 +177,51 @@ class VideoRecorder:
         :param size: tuple: The height and width of the video on the Label
         :param keep_ratio: bool: If true, the aspect ratio is kept for the video
         :param keep_playing: bool: If true, the VideoRecorder will continue to show the webcam view
+        :param encoder: str: 'nvenc', 'qsv', or 'amf' for NVIDIA, Intel, or AMD hardware encoding, 'x264' for software
+        encoding, or None to use the first hardware encoder that is available
         """
         self.fps = fps
         self.keep_playing = keep_playing
         self.frame_duration = float(1 / self.fps)
         self.label = label
-        if video_path:
-            self.video_output = os.path.join(pathlib.Path(video_path).parent,
-                                             pathlib.Path(video_path).stem + "_raw" +
-                                             pathlib.Path(video_path).suffix)
-        else:
-            self.video_output = None
+        self.video_output = self.__raw_video_path(video_path) if video_path else None
         self.audio_output = audio_path
         self.video_source = video_source
         self.audio_source = audio_source
         self.thread = None
+        self.video_thread = None
+        self.audio_thread = None
         self.recording = False
+        # Set while recording so the audio thread can block until recording starts instead of polling the flag
+        self.recording_event = threading.Event()
         self.playing = False
         self.cam = None
         self.cam_frame = None
-        self.new_frame = False
-        self.write_video = False
+        # Holds at most the two newest frames for the Label, stale frames are dropped when the display falls behind
+        self.display_queue = queue.Queue(maxsize=2)
+        self.display_deadline = 0
+        self.display_job = None
+        self.paint_pending = False
+        # Preview frames are pasted into one PhotoImage, created on the Tk thread when the first frame is shown
+        self.frame_image = None
+        # Kept up to date by Map/Unmap events while the preview is playing, see _bind_viewable
+        self.viewable = False
+        self.viewable_bindings = []
+        # Camera reads are written into this buffer once it's been allocated by the first frame
+        self.read_buf = None
         self.cam_thread_live = False
         self.mic = None
-        self.mic_data = []
+        # Recorded audio is appended to one buffer and handed to the wave writer as is, without joining chunks
+        self.mic_data = bytearray()
         self.mic_thread_live = False
         self.writer = None
+        # Captured frames are handed to a writer thread so encoding never holds up the capture cadence
+        self.write_queue = None
+        self.write_thread = None
+        # Frames captured for the recording, and those that couldn't be queued because the writer fell a full queue
+        # behind, both reset for every recording
+        self.recorded_frames = 0
+        self.dropped_frames = 0
         self.current_frame = 0
         self.p = None
         if keep_ratio:
@@ -131,12 +229,116 @@ class VideoRecorder:
             self.size = (size[0], int(size[0] / self.aspect_ratio))
         else:
             self.size = size
+        # Area resampling averages every source pixel when shrinking, bilinear is only used when enlarging
+        self.interpolation = cv2.INTER_AREA if self.size[0] < self.video_source[1][1] else cv2.INTER_LINEAR
+        if encoder is None:
+            encoder = self.default_encoder()
+        self.codec, self.codec_params = self.ENCODERS[encoder]
+        # Reused device buffers for resizing preview frames on the GPU when OpenCV was built with CUDA
+        self.gpu_src, self.gpu_dst = None, None
+        if hasattr(cv2.cuda, 'resize') and cv2.cuda.getCudaEnabledDeviceCount() > 0:
+            self.gpu_src, self.gpu_dst = cv2.cuda_GpuMat(), cv2.cuda_GpuMat()
+        self.resize_frame = self.__make_frame_resizer()
+
+    @staticmethod
+    def __raw_video_path(video_path):
+        """
+        Gets the path the video is recorded to before merge_sources writes the final file to video_path
+        :param video_path: path-like: Output save path of the recorded video
+        :return: str: The path with _raw appended to the file name
+        """
+        path = pathlib.Path(video_path)
+        return str(path.with_name(path.stem + "_raw" + path.suffix))
+
+    @staticmethod
+    def encoder_available(encoder):
+        """
+        Checks whether FFMPEG can encode with one of the ENCODERS on this machine, the result is cached after the first
+        call
+        :param encoder: str: Key of the encoder in VideoRecorder.ENCODERS
+        :return: bool: True if the encoder can be used
+        """
+        if encoder not in VideoRecorder._encoders_available:
+            codec, codec_params = VideoRecorder.ENCODERS[encoder]
+            # Probed with the same options and pixel format the recording writer uses, so an encoder that rejects them
+            # isn't chosen
+            cmd = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-f', 'lavfi', '-i', 'nullsrc=s=256x256:d=1',
+                   '-vcodec', codec, '-pix_fmt', 'yuv420p', *codec_params, '-f', 'null', '-']
+            try:
+                VideoRecorder._encoders_available[encoder] = subprocess.run(cmd, stdout=subprocess.DEVNULL,
+                                                                            stderr=subprocess.DEVNULL).returncode == 0
+            except OSError:
+                VideoRecorder._encoders_available[encoder] = False
+        return VideoRecorder._encoders_available[encoder]
+
+    @staticmethod
+    def default_encoder():
+        """
+        Gets the first of the ENCODERS that can be used on this machine.  The hardware encoders are probed at once, so
+        the first call waits for one FFMPEG probe rather than one per encoder, and x264 is the software fallback.
+        :return: str: Key of the encoder in VideoRecorder.ENCODERS
+        """
+        hardware = [name for name in VideoRecorder.ENCODERS if name != 'x264']
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(hardware)) as pool:
+            available = dict(zip(hardware, pool.map(VideoRecorder.encoder_available, hardware)))
+        return next((name for name in hardware if available[name]), 'x264')
+
+    @staticmethod
+    def nvenc_available():
+        """
+        Checks whether FFMPEG can encode with NVIDIA NVENC on this machine, the result is cached after the first call
+        :return: bool: True if the h264_nvenc encoder can be used
+        """
+        return VideoRecorder.encoder_available('nvenc')
+
+    @staticmethod
+    def __get_cached_sources(kind, poll, refresh):
+        """
+        Gets device sources from the process cache or a recent on-disk cache, polling the devices if neither is valid
+        :param kind: str: 'audio' or 'video'
+        :param poll: callable: Function that polls the devices, returns the sources and whether every device answered
+        :param refresh: bool: If true, the caches are ignored and the devices are polled again
+        :return: list: The sources
+        """
+        if not refresh and kind in VideoRecorder._sources:
+            return VideoRecorder._sources[kind]
+        key = f"{kind}|{platform.platform()}"
+        try:
+            with open(VideoRecorder.SOURCE_CACHE_PATH) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        entry = cache.get(key) if isinstance(cache, dict) else None
+        if not refresh and entry and time.time() - entry['time'] < VideoRecorder.SOURCE_CACHE_TTL_S:
+            sources = [(i, tuple(value) if isinstance(value, list) else value) for i, value in entry['sources']]
+        else:
+            sources, complete = poll()
+            # A device that did not answer may still be held by its probe, it could show up on the next poll, so the
+            # partial result is not cached
+            if not complete:
+                return sources
+            cache = cache if isinstance(cache, dict) else {}
+            cache[key] = {'time': time.time(), 'sources': sources}
+            temp_path = None
+            try:
+                cache_dir = os.path.dirname(VideoRecorder.SOURCE_CACHE_PATH)
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+                # Written to a new file and swapped in, so a concurrent run never reads a partly written cache
+                with tempfile.NamedTemporaryFile('w', dir=cache_dir, suffix='.tmp', delete=False) as f:
+                    temp_path = f.name
+                    json.dump(cache, f)
+                os.replace(temp_path, VideoRecorder.SOURCE_CACHE_PATH)
+            except OSError:
+                if temp_path is not None and os.path.exists(temp_path):
+                    os.remove(temp_path)
+        VideoRecorder._sources[kind] = sources
+        return sources
 
     @staticmethod
-    def get_audio_sources():
+    def __poll_audio_sources():
         """
         Polls the audio sources and gets their description
-        :return: tuple: First value is the output index, second value is the description
+        :return: tuple: List of tuples of the input index and the description, and True as every device is queried
         """
         sources = []
         p = pyaudio.PyAudio()
@@ -146,24 +348,72 @@ class VideoRecorder:
         for i in range(0, numdevices):
             if (p.get_device_info_by_host_api_device_index(0, i).get('maxInputChannels')) > 0:
                 sources.append((i, p.get_device_info_by_host_api_device_index(0, i).get('name')))
-        return sources
+        return sources, True
+
+    @staticmethod
+    def __poll_video_sources():
+        """
+        Polls webcam sources and finds their video resolution
+        :return: tuple: List of tuples of the source index and its resolution, and whether every probe finished in time
+        """
+        results = [None] * VideoRecorder.MAX_VIDEO_SOURCES
+
+        def probe(index):
+            try:
+                results[index] = VideoRecorder.__probe_video_source(index)
+            except (IndexError, OSError):
+                pass
+
+        # Every index is probed at once, indices can have gaps when a webcam has been unplugged so every index is kept
+        # checking past a missing webcam.  The probes run on daemon threads, a probe stuck on a webcam that never
+        # answers is left behind without keeping the interpreter from exiting.
+        probes = [threading.Thread(target=probe, args=(i,), daemon=True)
+                  for i in range(0, VideoRecorder.MAX_VIDEO_SOURCES)]
+        for thread in probes:
+            thread.start()
+        # All probes share one deadline so a poll never waits longer than VIDEO_PROBE_TIMEOUT_S in total
+        deadline = time.monotonic() + VideoRecorder.VIDEO_PROBE_TIMEOUT_S
+        for thread in probes:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # A probe that is still running keeps its webcam open until its read returns, the reader is closed by the
+        # probe itself
+        complete = not any(thread.is_alive() for thread in probes)
+        sources = [(i, shape) for i, shape in enumerate(results) if shape is not None]
+        return sources, complete
+
+    @staticmethod
+    def __probe_video_source(index):
+        """
+        Opens a webcam and reads one frame to find its video resolution
+        :param index: int: The webcam index
+        :return: tuple: The height and width of the webcam's frames
+        """
+        cam = imageio.get_reader(f'<video{index}>', fps=8)
+        try:
+            return cam.get_next_data().shape[0:2]
+        finally:
+            cam.close()
 
     @staticmethod
-    def get_video_sources():
+    def get_audio_sources(refresh=False):
+        """
+        Polls the audio sources and gets their description, results are cached for the process and for
+        SOURCE_CACHE_TTL_S seconds across runs
+        :param refresh: bool: If true, the devices are polled again instead of using cached results
+        :return: tuple: First value is the output index, second value is the description
+        """
+        return VideoRecorder.__get_cached_sources('audio', VideoRecorder.__poll_audio_sources, refresh)
+
+    @staticmethod
+    def get_video_sources(refresh=False):
         """
         Polls webcam sources and find their video resolution, i.e., (0, (780, 420)).  Passing one of these sources to
-        the VideoRecorder object will allow it to use that camera.
+        the VideoRecorder object will allow it to use that camera.  Results are cached for the process and for
+        SOURCE_CACHE_TTL_S seconds across runs.
+        :param refresh: bool: If true, the devices are polled again instead of using cached results
         :return: List of tuples containing found sources and their resolution.
         """
-        sources = []
-        for i in range(0, 10):
-            try:
-                cam = imageio.get_reader(f'<video{i}>', fps=8)
-                sources.append((i, cam.get_next_data().shape[0:2]))
-                cam.close()
-            except IndexError:
-                break
-        return sources
+        return VideoRecorder.__get_cached_sources('video', VideoRecorder.__poll_video_sources, refresh)
 
     def __save_audio_file(self, filename):
         """
@@ -179,10 +429,24 @@ class VideoRecorder:
         # set the sample rate
         wf.setframerate(self.mic_sample_rate)
         # write the frames as bytes
-        wf.writeframes(b"".join(self.mic_data))
+        wf.writeframes(self.mic_data)
         # close the file
         wf.close()
 
+    def __get_camera(self, source):
+        """
+        Opens a webcam with a single frame buffer and MJPG transfer so every read returns the most recent frame
+        :param source: tuple: Selected source from get_video_sources
+        :return: cv2.VideoCapture: Camera instance
+        """
+        cam = cv2.VideoCapture(source[0], cv2.CAP_DSHOW if os.name == 'nt' else cv2.CAP_ANY)
+        cam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        cam.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        cam.set(cv2.CAP_PROP_FRAME_WIDTH, source[1][1])
+        cam.set(cv2.CAP_PROP_FRAME_HEIGHT, source[1][0])
+        cam.set(cv2.CAP_PROP_FPS, self.fps)
+        return cam
+
     def __get_mic_recorder(self, source, chunk=1024, audio_format=pyaudio.paInt16, channels=1, sample_rate=44100):
         """
         Gets a microphone recording instance from a specified source
@@ -223,61 +487,80 @@ class VideoRecorder:
         """
         try:
             self.mic_thread_live = True
-            self.mic_data = []
+            self.mic_data = bytearray()
             while self.playing:
                 try:
                     if self.recording:
-                        self.mic_data.append(self.mic.read(self.mic_chunk))
+                        self.mic_data.extend(self.mic.read(self.mic_chunk))
                     else:
-                        time.sleep(0.01)
+                        # Wakes as soon as recording starts, the timeout only bounds how long stop_playback waits
+                        self.recording_event.wait(0.1)
                 except Exception as e:
                     if self.recording:
-                        print(
-                            f"ERROR: Exception encountered in tkVideoUtils.VideoRecorder audio recording thread: {str(e)}")
+                        log.error("Exception encountered in tkVideoUtils.VideoRecorder audio recording thread: %s", e)
             if self.mic_data:
                 self.__save_audio_file(self.audio_output)
             self.__close_mic_recorder()
             self.mic_thread_live = False
         except Exception as e:
-            print(f"ERROR: __audio_recording_thread exiting due to {str(e)}")
+            log.error("__audio_recording_thread exiting due to %s", e)
             return
 
     def __video_recording_thread(self):
         """
-        Thread that plays and records video in the background.  Will only update the image on the Label is the Label
-        is currently being viewed.
+        Thread that plays and records video in the background.  Frames are only decoded while recording or while the
+        Label is being viewed.
         :return: None
         """
         try:
             self.cam_thread_live = True
+            # Module lookups bound once as locals, they are hit on every captured frame
+            read, grab, cvt_color, bgr2rgb = self.cam.read, self.cam.grab, cv2.cvtColor, cv2.COLOR_BGR2RGB
+            queue_display_frame = self.__queue_display_frame
+            frame_duration = self.frame_duration
+            next_tick = time.monotonic()
             while self.playing:
                 try:
-                    start_time = time.time()
-                    self.cam_frame = self.cam.get_next_data()
-                    self.new_frame = True
-
-                    self.write_video = True
-                    if self.recording and not self.writer.closed:
-                        self.writer.append_data(self.cam_frame)
-                    self.write_video = False
-
-                    if self.recording:
-                        process_time = time.time() - start_time
+                    if not self.recording and not self.viewable:
+                        # Nothing will use the frame, only grab it to keep the camera's buffer current without decoding
+                        if not grab():
+                            raise IOError(f"Unable to read a frame from video source {self.video_source[0]}")
                     else:
-                        process_time = 0
-                    sleep_time = (self.frame_duration - process_time) - time.monotonic() % self.frame_duration
-                    if sleep_time >= 0:
-                        time.sleep(sleep_time)
+                        ok, frame = read(self.read_buf)
+                        if not ok:
+                            raise IOError(f"Unable to read a frame from video source {self.video_source[0]}")
+                        self.read_buf = frame
+                        self.cam_frame = cvt_color(frame, bgr2rgb)
+                        queue_display_frame(self.cam_frame)
+
+                        write_queue = self.write_queue
+                        if self.recording and write_queue is not None:
+                            self.recorded_frames += 1
+                            try:
+                                write_queue.put_nowait((self.recorded_frames, self.cam_frame))
+                            except queue.Full:
+                                # Keep the capture cadence and drop the frame rather than waiting on a stalled disk, the
+                                # writer fills the gap from the frame's number
+                                self.dropped_frames += 1
+                except IOError as e:
+                    # The camera may drop out briefly, back off for a frame rather than spinning on failed reads
+                    log.error("%s", e)
+                    time.sleep(frame_duration)
                 except Exception as e:
                     if self.recording:
-                        print(
-                            f"ERROR: Exception encountered in tkVideoUtils.VideoRecorder video recording thread: {str(e)}")
-            if self.writer:
-                self.writer.close()
-            self.cam.close()
+                        log.error("Exception encountered in tkVideoUtils.VideoRecorder video recording thread: %s", e)
+                # Pace against a monotonic deadline, frames are dropped rather than bursted when the loop falls behind
+                next_tick += frame_duration
+                sleep_time = next_tick - time.monotonic()
+                if sleep_time > 0:
+                    time.sleep(sleep_time)
+                elif sleep_time < -frame_duration:
+                    next_tick = time.monotonic()
+            self.__close_writer()
+            self.cam.release()
             self.cam_thread_live = False
         except Exception as e:
-            print(f"ERROR: __video_recording_thread exiting due to {str(e)}")
+            log.error("__video_recording_thread exiting due to %s", e)
             return
 
     def close_video_recording(self):
@@ -285,90 +568,256 @@ class VideoRecorder:
         Handles the recording objects so the playback stream doesn't have to end.
         :return: None
         """
-        while self.write_video:
-            continue
-        if self.writer:
-            self.writer.close()
+        self.__close_writer()
         if self.mic_data:
             self.__save_audio_file(self.audio_output)
-            self.mic_data = []
+            self.mic_data = bytearray()
 
-    def __video_display_thread(self):
+    @staticmethod
+    def __writer_thread(writer, write_queue):
         """
-        Thread that updates the video display label with the current frame
+        Thread that encodes queued frames until it receives a None frame, then closes the writer.  Frames dropped before
+        a queued frame are filled in by repeating the last written frame, so the video keeps the recording's length.
+        :param writer: imageio Writer: The writer opened by start_recording
+        :param write_queue: Queue: Tuples of the frame's number in the recording and the frame to write
         :return: None
         """
+        written, last_frame = 0, None
         try:
-            last_image = None
-            while self.playing:
-                try:
-                    if self.cam_frame is not None:
-                        if last_image is not None:
-                            while not self.new_frame:
-                                continue
-                        if self.label.winfo_viewable():
-                            frame_image = ImageTk.PhotoImage(Image.fromarray(self.cam_frame).resize(self.size))
-                            self.label.config(image=frame_image)
-                            self.label.image = frame_image
-                        last_image = self.cam_frame
-                except Exception as e:
-                    if self.recording:
-                        print(
-                            f"ERROR: Exception encountered in tkVideoUtils.VideoRecorder video recording thread: {str(e)}")
+            while True:
+                number, frame = write_queue.get()
+                if last_frame is not None:
+                    for _ in range(number - written - 1):
+                        writer.append_data(last_frame)
+                if frame is None:
+                    break
+                writer.append_data(frame)
+                written, last_frame = number, frame
         except Exception as e:
-            print(f"ERROR: __video_display_thread exiting due to {str(e)}")
+            log.error("__writer_thread exiting due to %s", e)
+        finally:
+            writer.close()
+
+    def __close_writer(self):
+        """
+        Stops queueing frames, waits for the writer thread to encode the frames still queued, and closes the writer
+        :return: None
+        """
+        write_queue, self.write_queue = self.write_queue, None
+        if write_queue is not None:
+            self.recording = False
+            self.recording_event.clear()
+            # Numbered after the last captured frame, so frames dropped at the end of the recording are filled in too
+            write_queue.put((self.recorded_frames + 1, None))
+            self.write_thread.join()
+            self.write_thread = None
+            if self.dropped_frames:
+                log.warning("%s frames were repeated in %s because the writer fell behind", self.dropped_frames,
+                            self.video_output)
+
+    def __queue_display_frame(self, frame):
+        """
+        Hands a captured frame to the display queue, dropping the oldest queued frame if the display is behind
+        :param frame: ndarray: The captured frame
+        :return: None
+        """
+        try:
+            self.display_queue.put_nowait(frame)
+        except queue.Full:
+            try:
+                self.display_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.display_queue.put_nowait(frame)
+
+    def __make_frame_resizer(self):
+        """
+        Builds the function that resizes captured frames to the Label size.  The size, interpolation, and GPU
+        availability are fixed once the VideoRecorder is created, so they are bound into the function along with the
+        reused output buffer instead of being looked up for every frame.
+        :return: callable: Takes a captured frame and returns the resized frame as an Image
+        """
+        size, interpolation, fromarray = self.size, self.interpolation, Image.fromarray
+        # The output buffer is allocated by the first frame and written into by every frame after it
+        buf = [None]
+        if self.gpu_src is not None:
+            gpu_src, gpu_dst, cuda_resize = self.gpu_src, self.gpu_dst, cv2.cuda.resize
+
+            def resize_frame(frame):
+                gpu_src.upload(frame)
+                cuda_resize(gpu_src, size, gpu_dst, interpolation=interpolation)
+                buf[0] = gpu_dst.download(buf[0])
+                return fromarray(buf[0])
+        else:
+            resize = cv2.resize
+
+            def resize_frame(frame):
+                buf[0] = resize(frame, size, buf[0], interpolation=interpolation)
+                return fromarray(buf[0])
+        return resize_frame
+
+    def __update_display(self):
+        """
+        Tk timer callback that paces the preview to the frame rate with a monotonic deadline, the paint itself is queued
+        with after_idle so it only runs once pending Tk events have been handled
+        :return: None
+        """
+        if not self.playing:
+            self.display_job = None
             return
+        try:
+            if not self.paint_pending:
+                self.paint_pending = True
+                self.label.after_idle(self.__paint_display)
+            now = time.monotonic()
+            self.display_deadline += self.frame_duration
+            if self.display_deadline < now:
+                self.display_deadline = now + self.frame_duration
+            self.display_job = self.label.after(max(1, int((self.display_deadline - now) * 1000)),
+                                                self.__update_display)
+        except _tkinter.TclError as e:
+            log.error("__update_display exiting due to %s", e)
+            self.display_job = None
+
+    def __paint_display(self):
+        """
+        Tk idle callback that shows the newest captured frame on the Label
+        :return: None
+        """
+        self.paint_pending = False
+        frame = None
+        try:
+            while True:
+                frame = self.display_queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            if frame is not None and self.viewable:
+                if self.frame_image is None:
+                    self.frame_image = ImageTk.PhotoImage('RGB', self.size, master=self.label)
+                self.frame_image.paste(self.resize_frame(frame))
+                if self.label.image is not self.frame_image:
+                    self.label.config(image=self.frame_image)
+                    self.label.image = self.frame_image
+        except _tkinter.TclError as e:
+            log.error("__paint_display failed due to %s", e)
 
-    def merge_sources(self, output, ffmpeg_path, overwrite='-y', delete_file=True):
+    def merge_sources(self, output, ffmpeg_path=None, overwrite='-y', delete_file=True):
         """
-        Uses FFMPEG to add an audio source to an MP4 file
+        Adds an audio source to an MP4 file, in-process with PyAV or with FFMPEG
         :param delete_file: bool: If true, the raw audio and video files are deleted
         :param output: path-like: Full filepath to output file including filename
-        :param ffmpeg_path: path-like: Full filepath to FFMPEG instance to use
+        :param ffmpeg_path: path-like: Full filepath to FFMPEG instance to use, if None the sources are merged in-process
+        with PyAV, falling back to the FFMPEG on the PATH or the one bundled with imageio-ffmpeg
         :param overwrite: string: -y to overwrite (default) or -n to not overwrite
         :return: bool: True if successful, False if unsuccessful
         """
         if not self.keep_playing:
-            while self.mic_thread_live or self.cam_thread_live:
-                time.sleep(0.01)
+            # Both threads save and close their outputs before exiting
+            for thread in (self.audio_thread, self.video_thread):
+                if thread is not None:
+                    thread.join()
+        if not self.audio_output or not os.path.exists(self.audio_output):
+            # No audio was captured, so the raw video is already the final file and does not need a remux pass
+            try:
+                if overwrite == '-n' and os.path.exists(output):
+                    return False
+                if delete_file:
+                    os.replace(self.video_output, output)
+                else:
+                    shutil.copy2(self.video_output, output)
+                return True
+            except OSError as e:
+                log.error("Exception encountered moving recorded video %s", e)
+                return False
+        if not ffmpeg_path:
+            if overwrite == '-n' and os.path.exists(output):
+                return False
+            try:
+                self.__mux_sources(self.video_output, self.audio_output, output)
+                if delete_file:
+                    os.remove(self.video_output)
+                    os.remove(self.audio_output)
+                return True
+            except Exception as e:
+                log.error("Exception encountered merging sources with PyAV, retrying with FFmpeg %s", e)
+                # Remove the partly written output, FFMPEG would otherwise refuse to write over it when run with -n
+                if os.path.exists(output):
+                    os.remove(output)
+            ffmpeg_path = shutil.which('ffmpeg') or imageio_ffmpeg.get_ffmpeg_exe()
         try:
-            ff = ffmpy.FFmpeg(
-                executable=ffmpeg_path,
-                inputs={self.video_output: None, self.audio_output: None},
-                outputs={output: f'-vcodec copy {overwrite} -shortest'}
-            )
-            ff.run()
+            subprocess.run([ffmpeg_path, '-i', self.video_output, '-i', self.audio_output,
+                            '-vcodec', 'copy', overwrite, '-shortest', output], check=True)
             if delete_file:
                 os.remove(self.video_output)
                 os.remove(self.audio_output)
             return True
-        except ffmpy.FFRuntimeError as ffre:
-            print(f"ERROR: Exception encountered merging audio and video sources {str(ffre)}")
+        except subprocess.CalledProcessError as cpe:
+            log.error("Exception encountered merging audio and video sources %s", cpe)
             return False
-        except ffmpy.FFExecutableNotFoundError as ffenfe:
-            print(f"ERROR: FFmpeg executable not found!")
+        except FileNotFoundError:
+            log.error("FFmpeg executable not found!")
             return False
         except Exception as e:
-            print(f"ERROR: Exception encountered with merging sources {str(e)}")
+            log.error("Exception encountered with merging sources %s", e)
             return False
 
+    @staticmethod
+    def __mux_sources(video_path, audio_path, output):
+        """
+        Copies the video packets and encodes the audio to AAC into one file, without starting an FFMPEG process.  Audio
+        past the end of the video is dropped, like FFMPEG's -shortest.
+        :param video_path: path-like: The recorded video
+        :param audio_path: path-like: The recorded wav file
+        :param output: path-like: Full filepath to output file including filename
+        :return: None
+        """
+        with av.open(video_path) as video_in, av.open(audio_path) as audio_in, av.open(output, 'w') as out:
+            video_stream, audio_stream = video_in.streams.video[0], audio_in.streams.audio[0]
+            video_out = out.add_stream_from_template(video_stream)
+            audio_out = out.add_stream('aac', rate=audio_stream.rate,
+                                       layout='mono' if audio_stream.channels == 1 else 'stereo')
+            if video_stream.duration is not None:
+                end_time = float(video_stream.duration * video_stream.time_base)
+            else:
+                end_time = video_in.duration / av.time_base
+            for packet in video_in.demux(video_stream):
+                # The demuxer ends each stream with an empty flush packet, it has nothing to write
+                if packet.dts is None:
+                    continue
+                packet.stream = video_out
+                out.mux(packet)
+            for frame in audio_in.decode(audio_stream):
+                if frame.time >= end_time:
+                    break
+                out.mux(audio_out.encode(frame))
+            out.mux(audio_out.encode(None))
+
     def start_recording(self, video_output=None, audio_output=None):
         """
         Start webcam recording, if an output path is provided then the original output path is overwritten.
+        Frames are dropped rather than stalling capture when the writer falls behind, and the writer repeats the last
+        written frame in their place so the video keeps the length of the recorded wav.  A warning with the count is
+        logged when the recording stops.
         :param video_output: path-like: Desired absolute filepath for the recorded video
         :param audio_output: path-like: Desired absolute filepath for the recorded audio
         :return: None
         """
         if video_output:
-            self.video_output = os.path.join(pathlib.Path(video_output).parent,
-                                             pathlib.Path(video_output).stem + "_raw" +
-                                             pathlib.Path(video_output).suffix)
-            self.writer = imageio.get_writer(self.video_output, fps=self.fps)
-        else:
-            self.writer = imageio.get_writer(self.video_output, fps=self.fps)
+            self.video_output = self.__raw_video_path(video_output)
+        self.__close_writer()
+        self.writer = imageio.get_writer(self.video_output, fps=self.fps, codec=self.codec,
+                                         output_params=list(self.codec_params))
+        self.recorded_frames = 0
+        self.dropped_frames = 0
+        self.write_queue = queue.Queue(maxsize=64)
+        self.write_thread = threading.Thread(target=self.__writer_thread, args=(self.writer, self.write_queue))
+        self.write_thread.daemon = True
+        self.write_thread.start()
         if audio_output:
             self.audio_output = audio_output
         self.recording = True
+        self.recording_event.set()
 
     def stop_recording(self):
         """
@@ -376,6 +825,7 @@ class VideoRecorder:
         :return: None
         """
         self.recording = False
+        self.recording_event.clear()
 
     def stop_playback(self):
         """
@@ -383,6 +833,11 @@ class VideoRecorder:
         :return: None
         """
         self.playing = False
+        if self.display_job:
+            self.label.after_cancel(self.display_job)
+            self.display_job = None
+        _unbind_viewable(self.viewable_bindings)
+        self.viewable_bindings = []
 
     def start_playback(self):
         """
@@ -391,7 +846,9 @@ class VideoRecorder:
         """
         self.playing = True
         self.current_frame = 0
-        self.cam = imageio.get_reader(f'<video{self.video_source[0]}>', fps=self.fps)
+        _unbind_viewable(self.viewable_bindings)
+        self.viewable_bindings = _bind_viewable(self, self.label)
+        self.cam = self.__get_camera(self.video_source)
         self.mic = self.__get_mic_recorder(self.audio_source[0])
         self.video_thread = threading.Thread(target=self.__video_recording_thread)
         self.video_thread.daemon = 1
@@ -399,19 +856,24 @@ class VideoRecorder:
         self.audio_thread = threading.Thread(target=self.__audio_recording_thread)
         self.audio_thread.daemon = 1
         self.audio_thread.start()
-        self.view_thread = threading.Thread(target=self.__video_display_thread)
-        self.view_thread.daemon = 1
-        self.view_thread.start()
+        self.label.image = None
+        self.display_deadline = time.monotonic()
+        self.display_job = self.label.after_idle(self.__update_display)
 
 
 class VideoPlayer:
     """
     Class that handles the streaming of a video file from the filesystem to a Label.
     """
+    # Hardware decoders tried in order when hwaccel='auto'
+    HWACCELS = ['cuda', 'qsv', 'd3d11va', 'videotoolbox', 'vaapi']
+    # Consecutive audio chunks handed to the output stream in one write, this also bounds how long stopping waits
+    AUDIO_CHUNKS_PER_WRITE = 4
 
     def __init__(self, root, video_path, audio_path, label, loading_gif, size=(640, 360), play_button=None,
                  play_image=None, pause_image=None, slider=None, slider_var=None, keep_ratio=False, skip_size_s=1,
-                 override_slider=False, cleanup_audio=False, auto_play=False):
+                 override_slider=False, cleanup_audio=False, auto_play=False, hwaccel=None, disk_cache=False,
+                 low_memory=False):
         """
         Streams a video on the filesystem to a tkinter Label.
         :param video_path: path-like: Absolute path to the video file to be streamed
@@ -427,17 +889,26 @@ class VideoPlayer:
         :param keep_ratio: bool: If True, the source aspect ratio will be kept
         :param skip_size_s: int: The number of seconds the video should skip when skipped forward or backward
         :param override_slider: bool: Set to true if you want to configure an external callback for the Slider
-        :param cleanup_audio: bool: Set to have separated audio track deleted after it's been loaded
+        :param cleanup_audio: bool: Set to not keep the separated audio track, it's decoded into memory instead
         :param auto_play: bool: Set to have the loaded video automatically start playing
+        :param hwaccel: str: Hardware decoder device type such as 'cuda', 'qsv', 'vaapi', 'd3d11va', or 'videotoolbox',
+        'auto' to use the first available device in VideoPlayer.HWACCELS, falls back to software decoding if the device
+        is unavailable.  None decodes on the CPU.
+        :param disk_cache: bool: Set to keep loaded frames in a memory-mapped temporary file instead of in memory, so
+        videos larger than the available RAM can be loaded
+        :param low_memory: bool: Set to keep loaded frames as 16 bit RGB565, a third smaller than 24 bit RGB at the cost
+        of some color depth
         """
         self.root = root
+        self.viewable_bindings = []
         self.setup_streams(video_path, audio_path, label, loading_gif, size, play_button, play_image,
                            pause_image, slider, slider_var, keep_ratio, skip_size_s,
-                           override_slider, cleanup_audio, auto_play)
+                           override_slider, cleanup_audio, auto_play, hwaccel, disk_cache, low_memory)
 
     def setup_streams(self, video_path, audio_path, label, loading_gif, size=(640, 360), play_button=None, play_image=None,
                       pause_image=None, slider=None, slider_var=None, keep_ratio=False, skip_size_s=1,
-                      override_slider=False, cleanup_audio=False, auto_play=False):
+                      override_slider=False, cleanup_audio=False, auto_play=False, hwaccel=None, disk_cache=False,
+                      low_memory=False):
         """
         Streams a video on the filesystem to a tkinter Label.
         :param video_path: path-like: Absolute path to the video file to be streamed
@@ -453,38 +924,49 @@ class VideoPlayer:
         :param keep_ratio: bool: If True, the source aspect ratio will be kept
         :param skip_size_s: int: The number of seconds the video should skip when skipped forward or backward
         :param override_slider: bool: Set to true if you want to configure an external callback for the Slider
-        :param cleanup_audio: bool: Set to have separated audio track deleted after it's been loaded
+        :param cleanup_audio: bool: Set to not keep the separated audio track, it's decoded into memory instead
         :param auto_play: bool: Set to have the loaded video automatically start playing
+        :param hwaccel: str: Hardware decoder device type such as 'cuda', 'qsv', 'vaapi', 'd3d11va', or 'videotoolbox',
+        'auto' to use the first available device in VideoPlayer.HWACCELS, falls back to software decoding if the device
+        is unavailable.  None decodes on the CPU.
+        :param disk_cache: bool: Set to keep loaded frames in a memory-mapped temporary file instead of in memory, so
+        videos larger than the available RAM can be loaded
+        :param low_memory: bool: Set to keep loaded frames as 16 bit RGB565, a third smaller than 24 bit RGB at the cost
+        of some color depth
         """
         self.video_path = video_path
         self.audio_path = audio_path
         self.audio_index = 0
         self.play_audio = False
         self.audio_chunk = 1024
+        # The loaded track, the size of one chunk of it in bytes, and the number of chunks including a short last one
+        self.audio_buffer = None
+        self.audio_chunk_size = 0
+        self.audio_chunk_count = 0
         self.cleanup_audio = False
         self.loading_gif = loading_gif
         if not os.path.exists(self.audio_path):
-            temp_audioclip = AudioFileClip(self.video_path)
-            if len(temp_audioclip.reader.buffer):
-                self.audio_loaded = True
-            else:
-                self.audio_loaded = False
-            temp_audioclip.close()
+            self.audio_loaded = self.has_audio_stream(self.video_path)
             self.cleanup_audio = cleanup_audio
         else:
             self.audio_loaded = True
         self.label = label
+        # Kept up to date by Map/Unmap events so playback doesn't query Tk for the Label's visibility
+        _unbind_viewable(self.viewable_bindings)
+        self.viewable_bindings = _bind_viewable(self, self.label)
         self.auto_play = auto_play
         self.playing = False
         self.skip_forward, self.skip_backward = False, False
         self.skip_size = skip_size_s
-        temp = imageio.get_reader(self.video_path)
-        self.raw_size = temp._get_data(0)[0].shape
-        temp.close()
-        meta_data = cv2.VideoCapture(self.video_path)
-        self.fps = meta_data.get(cv2.CAP_PROP_FPS)
+        # The container is opened once, its header gives the metadata and the loading thread decodes from it
+        container = self.open_video(self.video_path, hwaccel)
+        self.raw_size, self.fps, self.nframes = self.get_video_attr(container)
         self.frame_duration = float(1 / self.fps)
-        self.nframes = int(meta_data.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.skip_frames = int(self.skip_size * self.fps)
+        # While playing, the slider position is only moved every tenth of a second of video
+        self.slider_update_interval = max(1, int(self.fps / 10))
+        self.slider_position = 0
+        self.updating_slider = False
         self.current_frame = 0
         self.start_frame = None
         self.clip_frame = None
@@ -524,15 +1006,41 @@ class VideoPlayer:
         self.pause_image = pause_image
         if self.play_button:
             self.play_button.config(image=self.play_image, command=self.toggle_video)
-        meta_data.release()
 
         self.load_video_thread_live = False
         self.video_thread_live = False
         self.audio_thread_live = False
-        self.frames = []
+        self.audio_thread = None
+        # Frames are kept as arrays and pasted into a single PhotoImage, so no Tk image is created per frame
+        self.low_memory = low_memory
+        if disk_cache:
+            # The OS pages frames that aren't being shown out to the temporary file, which is deleted once closed
+            self.frame_cache = tempfile.TemporaryFile()
+            if low_memory:
+                self.frames = np.memmap(self.frame_cache, dtype='<u2', mode='w+',
+                                        shape=(self.nframes, self.size[1], self.size[0]))
+            else:
+                self.frames = np.memmap(self.frame_cache, dtype=np.uint8, mode='w+',
+                                        shape=(self.nframes, self.size[1], self.size[0], 3))
+        else:
+            self.frame_cache = None
+            self.frames = []
+        self.frame_image = ImageTk.PhotoImage('RGB', self.size, master=self.root)
+        # Playback runs as a Tk after() loop, frames are indexed by the time elapsed since play_start_index was shown
+        self.play_job = None
+        self.play_index = 0
+        self.play_start_index = 0
+        self.play_start_time = 0
+        self.set_position = None
+        # Slider drags are coalesced so only the newest position is loaded once pending Tk events have been handled
+        self.slider_value = None
+        self.slider_pending = False
+        self.loading_label = None
+        # Width of the loaded part of the loading slider the last time it was drawn
+        self.loaded_width = None
         self.loading = False
         self.load_frame_index = 0
-        self.load_thread = threading.Thread(target=self.__load_video)
+        self.load_thread = threading.Thread(target=self.__load_video, args=(container,))
         self.load_thread.daemon = True
         self.load_thread.start()
         if self.audio_loaded:
@@ -547,9 +1055,9 @@ class VideoPlayer:
         """
         self.p = pyaudio.PyAudio()
         self.stream = self.p.open(
-            format=self.p.get_format_from_width(self.audio_file.getsampwidth()),
-            channels=self.audio_file.getnchannels(),
-            rate=self.audio_file.getframerate(),
+            format=self.p.get_format_from_width(self.stream_attr["sampwidth"]),
+            channels=self.stream_attr["nchannels"],
+            rate=self.stream_attr["framerate"],
             frames_per_buffer=256,
             output=True
         )
@@ -563,6 +1071,113 @@ class VideoPlayer:
         self.p.terminate()
         self.start_stream()
 
+    @staticmethod
+    def has_audio_stream(video_path):
+        """
+        Checks whether a video file contains an audio stream, a file PyAV cannot open is treated as having no audio
+        :param video_path: path-like: Absolute path to the video file
+        :return: bool: True if the file has audio
+        """
+        try:
+            with av.open(video_path) as container:
+                return bool(container.streams.audio)
+        except av.error.FFmpegError as e:
+            log.error("Unable to probe %s for an audio stream %s", video_path, e)
+            return False
+
+    @staticmethod
+    def extract_audio(video_path, audio_path):
+        """
+        Uses FFMPEG to write the audio track of a video file to a 16 bit PCM wav file
+        :param video_path: path-like: Absolute path to the video file
+        :param audio_path: path-like: Absolute path to the output wav file
+        :return: None
+        """
+        subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-v', 'error', '-i', video_path, '-vn',
+                        '-acodec', 'pcm_s16le', audio_path], check=True)
+
+    @staticmethod
+    def decode_audio(video_path):
+        """
+        Decodes the audio track of a video file in-process with PyAV to interleaved 16 bit PCM, without writing a wav
+        file.  Tracks with more than two channels are downmixed to stereo.
+        :param video_path: path-like: Absolute path to the video file
+        :return: tuple: PCM bytes, dict of the same attributes get_wav_attr returns except params
+        """
+        with av.open(video_path) as container:
+            stream = container.streams.audio[0]
+            stream.thread_type = 'AUTO'
+            channels = min(stream.channels, 2)
+            resampler = av.AudioResampler(format='s16', layout='mono' if channels == 1 else 'stereo', rate=stream.rate)
+            frame_size = channels * 2
+            pcm = bytearray()
+            # None flushes the samples the resampler is still holding
+            for frame in chain(container.decode(stream), [None]):
+                for resampled in resampler.resample(frame):
+                    # Planes can be padded past the last sample
+                    pcm += memoryview(resampled.planes[0])[:resampled.samples * frame_size]
+        # Read-only bytes so the chunk views can be handed to pyaudio
+        return bytes(pcm), {"nchannels": channels,
+                            "sampwidth": 2,
+                            "framerate": stream.rate,
+                            "nframes": len(pcm) // frame_size}
+
+    @staticmethod
+    def open_video(video_path, hwaccel=None):
+        """
+        Opens a video file for decoding, on a hardware decoder if one is requested and can be created
+        :param video_path: path-like: Absolute path to the video file
+        :param hwaccel: str: Hardware decoder device type, 'auto' to try the available devices in
+        VideoPlayer.HWACCELS, or None to decode on the CPU
+        :return: av InputContainer: Open video file
+        """
+        if hwaccel:
+            try:
+                from av.codec.hwaccel import HWAccel, hwdevices_available
+            except ImportError as e:
+                log.error("Unable to decode on %s, falling back to software decoding: %s", hwaccel, e)
+                return av.open(video_path)
+            if hwaccel == 'auto':
+                devices = [device for device in VideoPlayer.HWACCELS if device in hwdevices_available()]
+            else:
+                devices = [hwaccel]
+            for device in devices:
+                try:
+                    return av.open(video_path, hwaccel=HWAccel(device_type=device, allow_software_fallback=True))
+                except (av.error.FFmpegError, ValueError) as e:
+                    log.error("Unable to decode on %s, falling back to software decoding: %s", device, e)
+        return av.open(video_path)
+
+    @staticmethod
+    def get_video_attr(container):
+        """
+        Reads the frame shape, frame rate, and frame count of a video from its container header without decoding
+        :param container: av InputContainer: Open video file
+        :return: tuple: (height, width, 3) frame shape, frames per second, number of frames
+        """
+        stream = container.streams.video[0]
+        fps = float(stream.average_rate or stream.guessed_rate)
+        nframes = stream.frames
+        if not nframes:
+            # Some containers do not store a frame count, estimate it from the duration
+            if stream.duration is not None:
+                nframes = int(stream.duration * stream.time_base * fps)
+            else:
+                nframes = int(container.duration / av.time_base * fps)
+        return (stream.codec_context.height, stream.codec_context.width, 3), fps, nframes
+
+    @staticmethod
+    def pack_rgb565(image):
+        """
+        Packs a 24 bit RGB frame into little-endian 16 bit RGB565
+        :param image: ndarray: (height, width, 3) uint8 frame
+        :return: ndarray: (height, width) uint16 frame
+        """
+        packed = (image[..., 0] >> 3).astype('<u2') << 11
+        packed |= (image[..., 1] >> 2).astype('<u2') << 5
+        packed |= image[..., 2] >> 3
+        return packed
+
     @staticmethod
     def get_wav_attr(audio_file):
         """
@@ -579,7 +1194,7 @@ class VideoPlayer:
     @staticmethod
     def set_img_color(img, colors, widths):
         """
-        Sets the colors of a PhotoImage column by column in place
+        Sets the colors of a PhotoImage column by column in place, each column is filled by Tk as a single rectangle
         Example: set_img_color(img, ['white', 'red'], [100, 100])
         Sets a column of width 100px to white and a column of width 100px to red from left to right
         :param img: PhotoImage
@@ -587,13 +1202,13 @@ class VideoPlayer:
         :param widths: list, widths to set columns to
         :return: None
         """
-        pixel_line = "{"
+        x = 0
+        height = img.height()
         for color, width in zip(colors, widths):
-            for i in range(0, width):
-                pixel_line = pixel_line + f" {color}"
-        pixel_line = pixel_line + "}"
-        pixels = " ".join(pixel_line for i in range(img.height()))
-        img.put(pixels)
+            if width > 0:
+                # Braced as a one pixel image so color names containing spaces stay a single pixel
+                img.put('{{' + color + '}}', to=(x, 0, x + width, height))
+                x += width
 
     def __clear_loading_slider(self):
         """
@@ -609,9 +1224,12 @@ class VideoPlayer:
         Updates the loading slider to the current number of loaded frames
         :return: None
         """
-        self.set_img_color(self.trough_img, ['white', 'red'],
-                           [int(self.size[0] * (self.load_frame_index / self.nframes)),
-                            self.size[0] - int(self.size[0] * (self.load_frame_index / self.nframes))])
+        loaded_width = int(self.size[0] * (self.load_frame_index / self.nframes))
+        if loaded_width == self.loaded_width:
+            # Not a single pixel more has loaded, the trough already shows this
+            return
+        self.loaded_width = loaded_width
+        self.set_img_color(self.trough_img, ['white', 'red'], [loaded_width, self.size[0] - loaded_width])
         self.slider.configure(style='custom.Horizontal.TScale')
 
     def __create_slider_style(self):
@@ -632,7 +1250,7 @@ class VideoPlayer:
                                                {'side': 'left', 'sticky': ''})]})])
             self.style.configure('custom.Horizontal.TScale', background=fig_color)
         except _tkinter.TclError:
-            print("INFO: Style already exists!")
+            log.info("Style already exists!")
             try:
                 self.style.element_create('Horizontal.Scale.trough', 'image', self.trough_img)
             except _tkinter.TclError:
@@ -640,9 +1258,10 @@ class VideoPlayer:
             return 'custom.Horizontal.TScale'
         return 'custom.Horizontal.TScale'
 
-    def __load_video(self):
+    def __load_video(self, container):
         """
         Background thread to load in frames to prevent issues when playing
+        :param container: av InputContainer: The video opened by setup_streams, closed once loading ends
         :return: None
         """
         try:
@@ -650,34 +1269,48 @@ class VideoPlayer:
             self.load_video_thread_live = True
             self.load_frame_index = 0
             last_image = None
+            array_equal = np.array_equal
             size = self.size
-            frame_data = imageio.get_reader(self.video_path)
-            for image in frame_data.iter_data():
-                if not self.loading:
-                    self.load_video_thread_live = False
-                    return
-                if image is not None:
+            # Redraw the loading slider about once per second of video or once per percent loaded, whichever is rarer
+            slider_interval = max(1, int(self.fps), int(self.nframes) // 100)
+            interpolation = 'AREA' if size[0] < self.raw_size[1] else 'BILINEAR'
+            # Decode in-process with PyAV, letting swscale convert from the decoder's native YUV and scale to the Label
+            # size in one pass
+            with container:
+                stream = container.streams.video[0]
+                stream.thread_type = 'AUTO'
+                for frame in container.decode(stream):
+                    image = frame.to_ndarray(width=size[0], height=size[1], format='rgb24', interpolation=interpolation)
+                    if self.low_memory:
+                        image = self.pack_rgb565(image)
+                    if not self.loading:
+                        self.load_video_thread_live = False
+                        return
                     try:
                         if last_image is not None:
-                            if (last_image == image).all():
+                            # A sparse grid of pixels rules out most new frames without scanning the whole frame, only
+                            # frames that match on the grid are compared in full
+                            if (array_equal(last_image[::32, ::32], image[::32, ::32]) and
+                                    array_equal(last_image, image)):
                                 continue
-                        resized_image = ImageTk.PhotoImage(Image.fromarray(image).resize(size))
-                        self.frames.append(resized_image)
+                        if self.frame_cache is not None and self.load_frame_index >= len(self.frames):
+                            log.info("%s has more frames than its header reported, the remaining frames aren't cached",
+                                     self.video_path)
+                            break
+                        if self.frame_cache is None:
+                            self.frames.append(image)
+                        else:
+                            self.frames[self.load_frame_index] = image
                         self.load_frame_index += 1
                         last_image = image
                         if not self.audio_loaded:
                             if self.load_frame_index == 1:
-                                self.load_frame(1)
-                        if self.load_frame_index % 10:
-                            if self.slider:
-                                if type(self.slider) == TickScale and self.loading:
-                                    self.__update_loading_slider()
-                                else:
-                                    self.load_video_thread_live = False
-                                    return
-                        if self.auto_play:
-                            if not self.audio_loaded:
-                                self.play()
+                                self.root.after_idle(self.load_frame, 1)
+                                if self.auto_play:
+                                    self.root.after_idle(self.play)
+                        if self.load_frame_index % slider_interval == 0:
+                            if type(self.slider) == TickScale and self.loading:
+                                self.root.after_idle(self.__update_loading_slider)
                     except IndexError as e:
                         self.load_video_thread_live = False
                         return
@@ -685,9 +1318,10 @@ class VideoPlayer:
                         self.load_video_thread_live = False
                         return
             self.load_video_thread_live = False
-            self.__clear_loading_slider()
+            if type(self.slider) == TickScale:
+                self.root.after_idle(self.__clear_loading_slider)
         except Exception as e:
-            print(f"ERROR: __load_video exiting due to {str(e)}")
+            log.error("__load_video exiting due to %s", e)
             return
 
     def play_video(self):
@@ -726,21 +1360,66 @@ class VideoPlayer:
         :param value: str: The slider value
         :return: None
         """
-        self.load_frame(value)
+        if self.updating_slider:
+            # The slider moved because playback moved it, the frame is already shown
+            return
+        self.slider_value = value
+        if not self.slider_pending:
+            self.slider_pending = True
+            self.root.after_idle(self.__load_slider_frame)
+
+    def __load_slider_frame(self):
+        """
+        Tk idle callback that loads the newest slider position, a drag fires the slider callback for every motion event
+        so only the last value seen before Tk went idle is loaded
+        :return: None
+        """
+        self.slider_pending = False
+        try:
+            self.load_frame(int(float(self.slider_value)))
+        except _tkinter.TclError as e:
+            log.error("__load_slider_frame failed due to %s", e)
+
+    def __show_frame(self, frame, _fromarray=Image.fromarray, _frombuffer=Image.frombuffer):
+        """
+        Pastes a loaded frame into the PhotoImage shown on the Label
+        :param frame: ndarray: The frame to display
+        :return: None
+        """
+        # Pillow's constructors are bound as defaults like the capture loop's locals, this runs for every shown frame
+        if frame.ndim == 2:
+            # Pillow's raw decoder expands little-endian RGB565 back to RGB
+            self.frame_image.paste(_frombuffer('RGB', self.size, frame, 'raw', 'BGR;16', 0, 1))
+        else:
+            self.frame_image.paste(_fromarray(frame))
+
+    def __attach_frame_image(self):
+        """
+        Sets the reused PhotoImage on the Label, Tk redraws the Label by itself whenever the PhotoImage is pasted into
+        :return: None
+        """
+        self.label.config(image=self.frame_image)
+        self.label.image = self.frame_image
 
     def load_frame(self, frame):
         """
         Loads the selected frame index into the Tk Label and sets the necessary control variables.
-        :param frame: int: The frame to load.
+        :param frame: int or str: The frame to load.
         :return: None
         """
-        if int(float(frame)) != self.current_frame:
+        if type(frame) != int:
+            frame = int(float(frame))
+        if not self.load_frame_index:
+            return
+        if frame != self.current_frame:
             try:
-                frame_image = self.frames[int(float(frame)) - 1]
-                if frame_image:
-                    self.label.config(image=frame_image)
-                    self.label.image = frame_image
-                    self.current_frame = int(float(frame))
+                if frame > self.load_frame_index:
+                    raise IndexError(f"Frame {frame} hasn't been loaded")
+                frame_image = self.frames[frame - 1]
+                if frame_image is not None:
+                    self.__show_frame(frame_image)
+                    self.__attach_frame_image()
+                    self.current_frame = frame
                     if self.slider:
                         self.slider.set(self.current_frame)
                 else:
@@ -748,9 +1427,9 @@ class VideoPlayer:
                         self.slider.set(self.current_frame)
             except IndexError:
                 frame_image = self.frames[self.load_frame_index - 1]
-                if frame_image:
-                    self.label.config(image=frame_image)
-                    self.label.image = frame_image
+                if frame_image is not None:
+                    self.__show_frame(frame_image)
+                    self.__attach_frame_image()
                     self.current_frame = self.load_frame_index - 1
                     if self.slider:
                         self.slider.set(self.current_frame)
@@ -767,8 +1446,12 @@ class VideoPlayer:
             self.playing = False
         if self.play_audio:
             self.play_audio = False
-        while self.audio_thread_live or self.video_thread_live:
-            time.sleep(0.001)
+        if self.video_thread_live:
+            self.__finish_playing()
+        if self.audio_thread is not None:
+            # The audio thread sees playing is False after writing at most one more chunk
+            self.audio_thread.join()
+            self.audio_thread = None
 
     def skip_video_forward(self):
         """
@@ -780,7 +1463,7 @@ class VideoPlayer:
             return
             # self.skip_forward = True
         else:
-            new_frame = self.current_frame + int(self.skip_size * self.fps)
+            new_frame = self.current_frame + self.skip_frames
             if new_frame > (self.load_frame_index - 1):
                 new_frame = self.load_frame_index - 1
             self.load_frame(new_frame)
@@ -795,7 +1478,7 @@ class VideoPlayer:
             return
             # self.skip_backward = True
         else:
-            new_frame = (self.current_frame - int(self.skip_size * self.fps))
+            new_frame = (self.current_frame - self.skip_frames)
             if new_frame < 1:
                 new_frame = 1
             self.load_frame(new_frame)
@@ -820,40 +1503,51 @@ class VideoPlayer:
 
     def __load_audio_thread(self):
         """
-        Loads in wav file for usage in audio playback thread, closes audio file once completed
+        Loads the audio track into memory for usage in audio playback thread
         :return: None
         """
         try:
-            loading_gif = ImageLabel(self.loading_gif, self.label, (self.size[1], self.size[1]))
-            temp_audioclip = AudioFileClip(self.video_path)
-            temp_audioclip.write_audiofile(self.audio_path, codec='pcm_s16le', verbose=False, logger=None)
-            loading_gif.unload()
-            self.load_frame(1)
-            self.audio_file = wave.open(self.audio_path, 'rb')
-            self.start_stream()
-            self.stream_attr = self.get_wav_attr(self.audio_file)
+            self.root.after_idle(self.__show_loading_gif)
             self.audio_loading = True
-            self.audio_data = []
-
-            while True:
-                if self.audio_loading:
-                    data = self.audio_file.readframes(self.audio_chunk)
-                    if data != b'':
-                        self.audio_data.append(data)
-                    else:
-                        break
-                else:
-                    break
-            self.audio_file.close()
+            if self.cleanup_audio:
+                # The wav file would only be deleted again, so the audio is decoded straight into memory instead
+                pcm, self.stream_attr = self.decode_audio(self.video_path)
+            else:
+                self.extract_audio(self.video_path, self.audio_path)
+                self.audio_file = wave.open(self.audio_path, 'rb')
+                self.stream_attr = self.get_wav_attr(self.audio_file)
+                pcm = self.audio_file.readframes(self.stream_attr["nframes"])
+                self.audio_file.close()
+            self.root.after_idle(self.__hide_loading_gif)
+            self.start_stream()
+            # The track is held in one buffer, the chunks written to the output stream are slices of it rather than
+            # thousands of separately allocated bytes objects
+            chunk_size = self.audio_chunk * self.stream_attr["nchannels"] * self.stream_attr["sampwidth"]
+            self.audio_buffer, self.audio_chunk_size = memoryview(pcm), chunk_size
+            self.audio_chunk_count = -(-len(pcm) // chunk_size)
             self.audio_loading = False
             if self.auto_play:
-                self.play()
-            if self.cleanup_audio:
-                os.remove(self.audio_path)
+                self.root.after_idle(self.play)
         except Exception as e:
-            print(f"ERROR: __load_audio_thread exiting due to {str(e)}")
+            log.error("__load_audio_thread exiting due to %s", e)
             return
 
+    def __show_loading_gif(self):
+        """
+        Shows the loading animation on the Label while the audio track is extracted
+        :return: None
+        """
+        self.loading_label = ImageLabel(self.loading_gif, self.label, (self.size[1], self.size[1]))
+
+    def __hide_loading_gif(self):
+        """
+        Removes the loading animation and shows the first frame on the Label
+        :return: None
+        """
+        self.loading_label.unload()
+        self.loading_label = None
+        self.load_frame(1)
+
     def __audio_thread(self):
         """
         Writes the current audio_index to the output stream
@@ -862,11 +1556,15 @@ class VideoPlayer:
         try:
             self.audio_thread_live = True
             try:
-                while (self.audio_index < len(self.audio_data) - 1) and self.playing:
+                last_chunk = self.audio_chunk_count - 1
+                audio_buffer, chunk_size = self.audio_buffer, self.audio_chunk_size
+                while (self.audio_index < last_chunk) and self.playing:
                     if self.play_audio:
                         if self.playing:
-                            self.stream.write(self.audio_data[self.audio_index])
-                            self.audio_index += 1
+                            # The chunks are consecutive in one buffer, so several are written with a single slice
+                            end = min(self.audio_index + self.AUDIO_CHUNKS_PER_WRITE, last_chunk)
+                            self.stream.write(audio_buffer[self.audio_index * chunk_size:end * chunk_size])
+                            self.audio_index = end
                         else:
                             break
                     else:
@@ -875,9 +1573,9 @@ class VideoPlayer:
                 self.stop_stream()
                 self.audio_thread_live = False
             except Exception as e:
-                print(str(e), traceback.print_exc())
+                log.error("__audio_thread failed writing audio due to %s", e)
         except Exception as e:
-            print(f"ERROR: __audio_thread exiting due to {str(e)}")
+            log.error("__audio_thread exiting due to %s", e)
             return
 
     def __update_audio_index(self):
@@ -886,90 +1584,140 @@ class VideoPlayer:
         :return: None
         """
         if self.audio_loaded:
-            self.audio_index = int((len(self.audio_data) * self.current_frame) / self.nframes)
+            self.audio_index = int((self.audio_chunk_count * self.current_frame) / self.nframes)
 
-    def __playing_thread(self):
+    def __paint_frame(self, i):
         """
-        Thread that will stream the video file to a Label at the source frame rate.
+        Shows a frame on the Label and moves the slider to it
+        :param i: int: The frame index
         :return: None
         """
+        if self.viewable:
+            self.__show_frame(self.frames[i])
+        # An overridden slider's callback is triggered for every frame, otherwise the slider is only moved once it's
+        # fallen slider_update_interval frames behind
+        if self.set_position is not None and (self.override_slider or
+                                              abs(i - self.slider_position) >= self.slider_update_interval):
+            self.__set_slider_position(i)
+
+    def __set_slider_position(self, i):
+        """
+        Moves the slider to a frame index without loading the frame again through the slider's callback
+        :param i: int: The frame index
+        :return: None
+        """
+        self.updating_slider = True
         try:
-            self.video_thread_live = True
-            n = self.nframes
-            i = int(self.current_frame)
-            self.playing = True
-            self.__update_audio_index()
-            self.play_audio = True
-            while i < n:
-                if not self.playing:
-                    break
-                try:
-                    if i < self.load_frame_index:
-                        im = self.frames[i]
-                        self.current_frame = i
-                        if self.label.winfo_viewable():
-                            frame_image = im
-                            self.label.config(image=frame_image)
-                            self.label.image = frame_image
-                        if self.override_slider:
-                            if self.slider:
-                                # Trigger callback each time a frame is loaded
-                                self.slider.set(i)
-                        else:
-                            if self.slider_var:
-                                self.slider_var.set(i)
-                        if self.start_frame is not None and self.clip_frame is not None:
-                            if not (self.start_frame <= i < self.clip_frame):
-                                break
-                        if self.skip_forward:
-                            i += int(self.skip_size * self.fps)
-                            self.skip_forward = False
-                        elif self.skip_backward:
-                            i -= int(self.skip_size * self.fps)
-                            self.skip_backward = False
-                        else:
-                            i += 1
-                        time.sleep(self.frame_duration - time.monotonic() % self.frame_duration)
-                    else:
-                        i = self.load_frame_index - 1
-                except StopIteration as e:
-                    print(str(e))
-                    break
-                except IndexError as e:
-                    print(str(e))
-                    self.playing = False
-                    if n == float("inf"):
-                        break
-                    raise
-            self.video_thread_live = False
-            time.sleep(0.01)
-            self.playing = False
-            self.play_audio = False
-            if self.current_frame > self.nframes:
-                self.current_frame = self.nframes
+            self.set_position(i)
+            self.slider_position = i
+        finally:
+            self.updating_slider = False
+
+    def __play_tick(self):
+        """
+        Tk timer callback that shows the frame that is due at the source frame rate, then schedules itself for the next
+        frame.  A late tick skips ahead to the frame that is due instead of playing every later frame late.
+        :return: None
+        """
+        self.play_job = None
+        try:
+            if not self.playing:
+                self.__finish_playing()
+                return
+            now = time.monotonic()
+            i = self.play_start_index + int((now - self.play_start_time) * self.fps)
+            if self.skip_forward:
+                self.play_start_index += self.skip_frames
+                i += self.skip_frames
+                self.skip_forward = False
+            elif self.skip_backward:
+                self.play_start_index -= self.skip_frames
+                i -= self.skip_frames
+                self.skip_backward = False
+            else:
+                i = max(self.play_index, i)
+            i = max(0, i)
+            if i >= self.nframes:
+                self.__finish_playing()
+                return
+            if i >= self.load_frame_index:
+                if not self.load_video_thread_live:
+                    self.__finish_playing()
+                    return
+                # Playback caught up with the loader, check again in a frame and restart the clock from this frame so
+                # it isn't skipped once it's loaded
+                self.play_index = i
+                self.play_start_index, self.play_start_time = i, now + self.frame_duration
+                self.play_job = self.root.after(max(1, int(self.frame_duration * 1000)), self.__play_tick)
+                return
+            self.current_frame = i
+            self.__paint_frame(i)
+            if self.start_frame is not None and self.clip_frame is not None:
+                if not (self.start_frame <= i < self.clip_frame):
+                    self.__finish_playing()
+                    return
+            self.play_index = i + 1
+            delay = self.play_start_time + (i + 1 - self.play_start_index) * self.frame_duration - time.monotonic()
+            self.play_job = self.root.after(max(1, int(delay * 1000)), self.__play_tick)
+        except (_tkinter.TclError, IndexError) as e:
+            log.error("__play_tick exiting due to %s", e)
+            self.__finish_playing()
+
+    def __finish_playing(self):
+        """
+        Ends the playback loop, lands the slider on the last frame shown and resets the play button
+        :return: None
+        """
+        if self.play_job is not None:
+            self.root.after_cancel(self.play_job)
+            self.play_job = None
+        self.video_thread_live = False
+        self.playing = False
+        self.play_audio = False
+        if self.current_frame > self.nframes:
+            self.current_frame = self.nframes
+        try:
+            if self.set_position is not None:
+                # Lands the slider on the last frame shown, it may have been left up to slider_update_interval behind
+                self.__set_slider_position(self.current_frame)
             if self.play_button:
                 self.play_button.config(image=self.play_image)
-        except Exception as e:
-            print(f"ERROR: __playing_thread exiting due to {str(e)}")
-            return
+        except _tkinter.TclError as e:
+            log.error("__finish_playing failed due to %s", e)
 
     def play(self):
         """
-        Creates a thread that plays the video frames onto the Label at the source FPS.
+        Plays the video frames onto the Label at the source FPS from a Tk after() loop, so every Tk call is made on the
+        Tk thread.  Must be called from the Tk thread.
         :return: None
         """
+        if self.video_thread_live:
+            return
+        if self.audio_thread is not None:
+            # The audio thread from the last playback may still be replacing the output stream after the video ended
+            self.audio_thread.join()
+            self.audio_thread = None
         self.playing = True
         if self.current_frame == self.nframes - 1:
             self.current_frame = 0
         if self.start_frame is not None:
             self.current_frame = self.start_frame
-        video_thread = threading.Thread(target=self.__playing_thread)
-        video_thread.daemon = True
-        video_thread.start()
+        if self.override_slider:
+            # Trigger callback each time a frame is loaded
+            self.set_position = self.slider.set if self.slider else None
+        else:
+            self.set_position = self.slider_var.set if self.slider_var else None
+        self.__update_audio_index()
+        self.play_audio = True
+        self.__attach_frame_image()
+        self.video_thread_live = True
+        self.play_index = self.play_start_index = int(self.current_frame)
+        self.play_start_time = time.monotonic()
+        self.play_job = self.root.after_idle(self.__play_tick)
         if self.audio_loaded:
-            audio_thread = threading.Thread(target=self.__audio_thread)
-            audio_thread.daemon = True
-            audio_thread.start()
+            self.audio_thread = threading.Thread(target=self.__audio_thread)
+            self.audio_thread.daemon = True
+            self.audio_thread.start()
 
     def close(self):
         """
@@ -979,17 +1727,30 @@ class VideoPlayer:
         self.loading = False
         self.playing = False
         self.audio_loading = False
+        _unbind_viewable(self.viewable_bindings)
+        self.viewable_bindings = []
+        # Waits for the loader, it stops within a frame of loading being cleared so it never writes to a closed cache
+        if self.load_thread is not threading.current_thread():
+            self.load_thread.join()
+        self.load_frame_index = 0
+        self.frames = []
+        if self.frame_cache is not None:
+            # Closing the temporary file deletes it and frees its descriptor without waiting for garbage collection
+            self.frame_cache.close()
+            self.frame_cache = None
 
 
-def cp_rename(src, dst, name):
+def cp_rename(src, dst, name, keep_src=True):
     """
     Small utility for handling recorded videos.  Copy and rename a file on the filesystem.
     :param src: path-like: Absolute filepath to the source video
     :param dst: path-like: Absolute filepath to the folder to move the src to
     :param name: str: New name for file being moved
+    :param keep_src: bool: If False, the file is moved instead of copied, which is a rename on the same filesystem
     :return:
     """
-    shutil.copy2(src, dst)
-    dst_file = os.path.join(dst, pathlib.Path(src).name)
-    new_dst_file = os.path.join(dst, name + pathlib.Path(src).suffix)
-    os.rename(dst_file, new_dst_file)
+    new_dst_file = os.path.join(dst, name + os.path.splitext(src)[1])
+    if keep_src:
+        shutil.copy2(src, new_dst_file)
+    else:
+        shutil.move(src, new_dst_file)